@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# test_tile2360.py -- tests for tile2360.py
+#
+# Run with: python -m unittest test_tile2360
+
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+
+import tile2360
+
+# Write a 24 bit BMP file; image is a list of rows of (b, g, r) tuples
+def writeBitmap(name, image):
+    width = len(image[0])
+    height = len(image)
+    row_size = ((24 * width + 31) / 32) * 4
+    fp = open(name, "wb")
+    fp.write(struct.pack("<2s6L2H6L",
+            "BM", 54 + row_size * height, 0, 54, 40, width, height,
+            1, 24, 0, row_size * height, 0, 0, 0, 0))
+    for y in xrange(height - 1, -1, -1):
+        for pixel in image[y]:
+            fp.write(struct.pack("<3B", *pixel))
+        fp.write("\0" * (row_size - 3 * width))
+    fp.close()
+
+# A tile with a sprite of random colors on a black background, leaving a
+# margin of black at the edges
+def spriteTile(rng, tile_width, tile_height):
+    black = ( 0, 0, 0 )
+    colors = [ tuple([ rng.randrange(1, 256) for i in xrange(0, 3) ])
+               for j in xrange(0, 3) ]
+    mx = rng.randrange(1, max(tile_width / 4, 2))
+    my = rng.randrange(1, max(tile_height / 4, 2))
+    tile = []
+    for y in xrange(0, tile_height):
+        row = []
+        for x in xrange(0, tile_width):
+            if mx <= x < tile_width - mx and my <= y < tile_height - my \
+            and rng.random() < 0.7:
+                row.append(rng.choice(colors))
+            else:
+                row.append(black)
+        tile.append(row)
+    return tile
+
+# A tile that fills its whole area with a random texture
+def fullTile(rng, tile_width, tile_height):
+    colors = [ tuple([ rng.randrange(0, 256) for i in xrange(0, 3) ])
+               for j in xrange(0, 2) ]
+    return [ [ rng.choice(colors) for x in xrange(0, tile_width) ]
+             for y in xrange(0, tile_height) ]
+
+# Lay out 1057 tiles, tiles_per_row to a row, padding the last row with black
+def tileSheet(make_tile, tile_width, tile_height, tiles_per_row, seed=1):
+    rng = random.Random(seed)
+    tile_rows = (1057 + tiles_per_row - 1) / tiles_per_row
+    black = [ [ (0, 0, 0) ] * tile_width ] * tile_height
+    tiles = [ make_tile(rng, tile_width, tile_height)
+              for t in xrange(0, 1057) ]
+    tiles += [ black ] * (tile_rows * tiles_per_row - 1057)
+    image = []
+    for r in xrange(0, tile_rows):
+        row_tiles = tiles[r * tiles_per_row : (r + 1) * tiles_per_row]
+        for y in xrange(0, tile_height):
+            row = []
+            for tile in row_tiles:
+                row.extend(tile[y])
+            image.append(row)
+    return image
+
+class DetectTilesTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def detect(self, image, tile_width=None, tile_height=None):
+        name = os.path.join(self.dir, "tiles.bmp")
+        writeBitmap(name, image)
+        return tile2360.Bitmap(name).detectTiles(tile_width, tile_height)
+
+    def checkLayout(self, make_tile, tile_width, tile_height, tiles_per_row):
+        candidates = self.detect(tileSheet(
+                make_tile, tile_width, tile_height, tiles_per_row))
+        confidence, tw, th, cols = candidates[0]
+        self.assertEqual((tw, th, cols),
+                (tile_width, tile_height, tiles_per_row))
+        self.assertTrue(confidence >= tile2360.MIN_CONFIDENCE)
+
+    def testStandardSprites(self):
+        self.checkLayout(spriteTile, 16, 16, 40)
+
+    def testStandardFull(self):
+        self.checkLayout(fullTile, 16, 16, 40)
+
+    def testNonSquareSprites(self):
+        self.checkLayout(spriteTile, 16, 24, 40)
+
+    def testNonSquareFull(self):
+        self.checkLayout(fullTile, 16, 24, 40)
+
+    def testColumnsSprites(self):
+        self.checkLayout(spriteTile, 12, 12, 32)
+
+    def testColumnsFull(self):
+        self.checkLayout(fullTile, 12, 12, 32)
+
+    def testGivenSize(self):
+        image = tileSheet(spriteTile, 16, 16, 40)
+        candidates = self.detect(image, 16, 16)
+        self.assertEqual([ c[1:] for c in candidates ], [ (16, 16, 40) ])
+
+    def testBlankImage(self):
+        image = [ [ (0, 0, 0) ] * 640 ] * 432
+        self.assertEqual(self.detect(image), [])
+
+    def testBadSize(self):
+        image = tileSheet(spriteTile, 16, 16, 40)
+        self.assertRaises(RuntimeError, self.detect, image, 0, None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -31,6 +31,12 @@ import os.path
 import struct
 import sys
 
+# Limits on the tile layouts that detectTiles will consider
+MIN_TILE_SIZE = 4
+MAX_TILE_ASPECT = 2
+# Below this confidence, a detected layout is not trusted
+MIN_CONFIDENCE = 0.1
+
 # A Bitmap image, with some extra methods for tile mapping
 class Bitmap(object):
     def __init__(self, inpname):
@@ -162,6 +168,100 @@ class Bitmap(object):
         self.tiles_per_row = None
         self.tile_rows = None
         self.tiles = None
+        self.col_edges = None
+        self.row_edges = None
+
+    # Count, for each pair of adjacent pixel columns and each pair of adjacent
+    # pixel rows, the pixels that differ across the boundary. This is done
+    # once per image; scoring a candidate grid then only needs to fold the
+    # two lists.
+    def edgeStatistics(self):
+        if self.col_edges is None:
+            # col_edges[x] counts differences between columns x and x + 1
+            if self.width > 1:
+                self.col_edges = map(sum, zip(*[
+                        map(lambda a, b : a != b, row[:-1], row[1:])
+                        for row in self.image]))
+            else:
+                self.col_edges = []
+            # row_edges[y] counts differences between rows y and y + 1
+            self.row_edges = [
+                    sum(map(lambda a, b : a != b,
+                            self.image[y], self.image[y + 1]))
+                    for y in xrange(0, self.height - 1)]
+        return self.col_edges, self.row_edges
+
+    # Score candidate tile layouts for a 3.4.3 tile set of num_tiles tiles.
+    # The tile width and height, if known, restrict the candidates.
+    # Returns a list of (confidence, tile_width, tile_height, tiles_per_row),
+    # best first; the confidences are between 0 and 1.
+    def detectTiles(self, tile_width=None, tile_height=None, num_tiles=1057):
+        if (tile_width is not None and tile_width <= 0) \
+        or (tile_height is not None and tile_height <= 0):
+            raise RuntimeError, "Tile dimensions must be positive"
+        col_edges, row_edges = self.edgeStatistics()
+
+        # Fold the edge counts by position within a tile of the given size,
+        # and return the fraction of their variance that the position
+        # explains, adjusted for the number of positions. Every tile has the
+        # same boundary in the same place, whether it is a sprite on a
+        # shared background (few differences) or fills the whole tile (many
+        # differences), so the right size gives a strongly periodic profile.
+        def periodicity(edges, size, count):
+            n = size * count - 1
+            if count <= 1 or size <= 1 or n <= size:
+                return 0.0
+            samples = edges[:n]
+            mean = float(sum(samples)) / n
+            total = sum([ (e - mean) ** 2 for e in samples ])
+            if total == 0:
+                return 0.0
+            between = 0.0
+            for p in xrange(0, size):
+                group = samples[p::size]
+                p_mean = float(sum(group)) / len(group)
+                between += len(group) * (p_mean - mean) ** 2
+            fit = 1.0 - (1.0 - between / total) * (n - 1) / (n - size)
+            return max(fit, 0.0)
+
+        if tile_width is not None:
+            widths = [ tile_width ]
+        else:
+            widths = xrange(MIN_TILE_SIZE, self.width + 1)
+        candidates = []
+        for tw in widths:
+            # The number of columns determines the number of rows, since
+            # only the last row may be partly filled
+            cols = self.width / tw
+            if cols == 0:
+                continue
+            rows = (num_tiles + cols - 1) / cols
+            if tile_height is not None:
+                th = tile_height
+            else:
+                th = self.height / rows
+            if th == 0 or self.height / th != rows:
+                continue
+            # Skip implausibly small or elongated tiles, unless given
+            if tile_width is None or tile_height is None:
+                if th < MIN_TILE_SIZE \
+                or tw > th * MAX_TILE_ASPECT or th > tw * MAX_TILE_ASPECT:
+                    continue
+            coverage = float(cols * tw * rows * th) / (self.width * self.height)
+            score = periodicity(col_edges, tw, cols) \
+                  * periodicity(row_edges, th, rows) \
+                  * coverage
+            candidates.append((score, tw, th, cols))
+
+        # The confidence is the score, scaled by its share of all the scores:
+        # it is low if the layout explains little, or if others do as well
+        total = sum([ c[0] for c in candidates ])
+        if total == 0:
+            return []
+        candidates = [ (score * score / total, tw, th, cols)
+                       for score, tw, th, cols in candidates ]
+        candidates.sort(key=lambda c : -c[0])
+        return candidates
 
     # Split the image into tiles
     def split(self, tile_width, tile_height):
@@ -583,6 +683,7 @@ def convertBitmap(inpname, args):
     tile_height = args.tile_height
     no_statues = args.no_statues
     outname = args.output
+    scan = args.scan
 
     # Provide default output file name
     if outname is None:
@@ -596,11 +697,32 @@ def convertBitmap(inpname, args):
     # Read the bitmap image
     bmp = Bitmap(inpname)
 
-    # Provide default tile dimensions
-    if tile_width is None:
-        tile_width = bmp.width / 40
-    if tile_height is None:
-        tile_height = tile_width
+    # Report the layouts found, without converting
+    if scan:
+        candidates = bmp.detectTiles(tile_width, tile_height)
+        sys.stdout.write("%s: %d x %d pixels\n"
+                % (inpname, bmp.width, bmp.height))
+        if len(candidates) == 0:
+            sys.stdout.write("    no tile layout found\n")
+        for confidence, tw, th, cols in candidates[:5]:
+            sys.stdout.write("    %3d x %-3d tiles, %3d per row: %5.1f%%\n"
+                    % (tw, th, cols, confidence * 100.0))
+        return len(candidates) != 0 and candidates[0][0] >= MIN_CONFIDENCE
+
+    # Detect the tile layout, unless it is given
+    if tile_width is None or tile_height is None:
+        candidates = bmp.detectTiles(tile_width, tile_height)
+        if len(candidates) != 0 and candidates[0][0] >= MIN_CONFIDENCE:
+            confidence, tile_width, tile_height, cols = candidates[0]
+        else:
+            # Fall back to 40 square tiles per row
+            sys.stderr.write("%s: could not detect the tile size; assuming "
+                    "40 square tiles per row.\nUse --tile-width and "
+                    "--tile-height if this is wrong.\n" % inpname)
+            if tile_width is None:
+                tile_width = bmp.width / 40
+            if tile_height is None:
+                tile_height = tile_width
 
     # Split the bitmap into tiles
     bmp.split(tile_width, tile_height)
@@ -614,13 +736,19 @@ def convertBitmap(inpname, args):
     # Write to disk
     bmp.write(outname)
 
-# Define command line arguments for this program
-parser = argparse.ArgumentParser(
+if __name__ == '__main__':
+    # Define command line arguments for this program
+    parser = argparse.ArgumentParser(
             formatter_class=argparse.RawDescriptionHelpFormatter,
             description='Convert NetHack 3.4.3 tile sets for use with 3.6.0',
             epilog='''
-If --tile-width is not specified, it is the image width divided by 40.
-If --tile-height is not specified, it is equal to the tile width.
+If --tile-width or --tile-height is not specified, it is detected from the
+   image: each layout that holds the 1057 tiles of 3.4.3 is scored by how
+   regularly the pixel changes repeat from one tile to the next. If no layout
+   is detected with confidence, the tile width is the image width divided by
+   40 and tiles are square.
+If --scan is specified, the best layouts and their confidence are listed and
+   no image is converted.
 If --no-statues is specified, statue glyphs are copied from the 3.4.3 statue
    glyph; if not, statue glyphs are generated by converting the monster glyphs
    to grayscale.
@@ -630,26 +758,34 @@ Images must be in BMP format.
 If --output is not specified, the output file name is <input-name>-360.bmp.
 Multiple images can be converted, but only if --output is not specified.
 ''')
-parser.add_argument('images', metavar='image', type=str, nargs='+',
+    parser.add_argument('images', metavar='image', type=str, nargs='+',
             help='Name of a tile set image for NetHack 3.4.3')
-parser.add_argument('--tile-width', '-x', dest='tile_width', type=int,
+    parser.add_argument('--tile-width', '-x', dest='tile_width', type=int,
             help='Width of a single tile in pixels')
-parser.add_argument('--tile-height', '-y', dest='tile_height', type=int,
+    parser.add_argument('--tile-height', '-y', dest='tile_height', type=int,
             help='Height of a single tile in pixels')
-parser.add_argument('--no-statues', '-s', dest='no_statues',
+    parser.add_argument('--no-statues', '-s', dest='no_statues',
             action='store_true',
             help='Do not derive statues from monsters')
-parser.add_argument('--output', '-o', dest='output', type=str,
+    parser.add_argument('--scan', '-n', dest='scan',
+            action='store_true',
+            help='List detected tile layouts; do not convert')
+    parser.add_argument('--output', '-o', dest='output', type=str,
             help='Name of output image')
 
-args = parser.parse_args()
-if len(args.images) > 1 and args.output is not None:
-    sys.stderr.write("Cannot specify --output with more than one image name\n")
-    sys.exit(1)
-
-# Process each image in turn
-rc = 0
-for image in args.images:
-    if not convertBitmap(image, args):
-        rc = 1
-sys.exit(rc)
+    args = parser.parse_args()
+    if len(args.images) > 1 and args.output is not None:
+        sys.stderr.write(
+                "Cannot specify --output with more than one image name\n")
+        sys.exit(1)
+    if (args.tile_width is not None and args.tile_width <= 0) \
+    or (args.tile_height is not None and args.tile_height <= 0):
+        sys.stderr.write("Tile width and height must be positive\n")
+        sys.exit(1)
+
+    # Process each image in turn
+    rc = 0
+    for image in args.images:
+        if not convertBitmap(image, args):
+            rc = 1
+    sys.exit(rc)